@@ -1,80 +1,431 @@
 """
 Pinterest Board Image Downloader (Playwright) with .env support
-Downloads images from a Pinterest board using the built-in download button
+Downloads images from a Pinterest board straight from pinimg, falling back to
+the built-in download button
 """
 
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
-import time
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
+import asyncio
+import functools
+from collections import deque
+import atexit
+from concurrent.futures import ThreadPoolExecutor
 import os
+import re
 import hashlib
-import json
+import sqlite3
 from pathlib import Path
 from dotenv import load_dotenv
+import httpx
+from pybloom_live import ScalableBloomFilter
 import random
 
 # Load environment variables
 load_dotenv()
 
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+ORIGINAL_EXTENSIONS = ('.jpg', '.png', '.gif', '.webp')
+
+PIN_SELECTOR = '[data-test-id="pin"]'
+PIN_IMAGE_SELECTOR = 'img[src*="pinimg"]'
+
+IMAGE_ID_RE = re.compile(r'/([0-9a-f]{32})\.\w+$')
+LEGACY_FILENAME_ID_RE = re.compile(r'[0-9a-f]{32}\.')
+PIN_ID_RE = re.compile(r'/pin/(\d+)')
+IMAGE_SIZE_RE = re.compile(r'/\d+x\d*/')
+
+FALLBACK_WORKERS = 8
+FETCH_WORKERS = 30
+# Boards scrolled at the same time when several are given.
+BOARD_WORKERS = 4
+# Closeup actions without their own timeout give up after this many ms
+# instead of Playwright's 30 s default.
+CLOSEUP_TIMEOUT = 4000
+# Limits of the closeup's own steps, in ms for Playwright calls and in
+# seconds for the rest.
+PIN_RESOURCE_TIMEOUT = 5000
+IMAGE_WAIT_TIMEOUT = 5000
+BUTTON_TIMEOUT = 3000
+DOWNLOAD_START_TIMEOUT = 20000
+CLOSEUP_FETCH_TIMEOUT = 15
+DOWNLOAD_TIMEOUT = 10
+# Seconds a closeup fallback may take once it has a page; pins that run
+# over are retried one at a time at the end with the longer limit. The
+# closeup never waits on the shared fetch limit, and the limit sits a margin
+# above its steps combined, so a step that gives up still reports its own
+# failure instead of being cut off.
+PIN_TIMEOUT_MARGIN = 5
+PIN_TIMEOUT = (
+    PIN_RESOURCE_TIMEOUT / 1000
+    # Either the PinResource image is fetched or the src is read.
+    + max(CLOSEUP_FETCH_TIMEOUT, (IMAGE_WAIT_TIMEOUT + CLOSEUP_TIMEOUT) / 1000)
+    + 2 * BUTTON_TIMEOUT / 1000
+    + DOWNLOAD_START_TIMEOUT / 1000 + DOWNLOAD_TIMEOUT
+    + PIN_TIMEOUT_MARGIN)
+RETRY_PIN_TIMEOUT = 2 * PIN_TIMEOUT
+# Outcomes are committed to the database in batches of this size.
+DB_COMMIT_EVERY = 25
+# Schema version stored in PRAGMA user_version once the folder is first scanned.
+DB_VERSION = 1
+# Images smaller than this are thumbnails or icons rather than originals.
+MIN_IMAGE_BYTES = 70 * 1024
+
+# Pin discovery only reads attributes from the DOM, so none of these need to
+# be fetched while scrolling the board.
+BLOCKED_RESOURCE_TYPES = {'image', 'font', 'media'}
+# Closeup pages still need the pinimg image for the src fallback.
+CLOSEUP_BLOCKED_RESOURCE_TYPES = {'font', 'media'}
+BLOCKED_URL_PARTS = ('analytics', 'doubleclick', 'googletagmanager', 'googlesyndication',
+                     'hotjar', 'segment.io', 'sentry.io')
+
+# Every known variant of each closeup button, matched in a single query:
+# accessible role and name first, then the older attribute/text hooks.
+MORE_OPTIONS_NAME = re.compile(r'^More (options|actions)$', re.I)
+DOWNLOAD_BUTTON_NAME = re.compile(r'^Download( image)?$', re.I)
+MORE_OPTIONS_SELECTOR = ('[aria-label="More options"], [data-test-id="more-options-button"], '
+                         '[aria-label="More actions"], button:has-text("More")')
+DOWNLOAD_BUTTON_SELECTOR = (':text-is("Download image"), :text-is("Download"), '
+                            '[data-test-id="download-button"]')
+
+CHROMIUM_ARGS = [
+    '--disable-blink-features=AutomationControlled',
+    '--disable-dev-shm-usage',
+    '--disable-gpu',
+    '--disable-extensions',
+    '--mute-audio',
+    '--disable-background-networking',
+    '--disable-sync',
+    '--disable-default-apps',
+    '--no-first-run',
+    # Closeup pages run as background tabs in a headed browser; keep their
+    # timers and rendering at full speed.
+    '--disable-background-timer-throttling',
+    '--disable-backgrounding-occluded-windows',
+    '--disable-renderer-backgrounding',
+]
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
+
+# Scrolls the whole board in-page, passing each tick's new pins to the
+# exposed reportPins binding, and resolves with how many it saw. Tiles are
+# collected on every tick because the grid unmounts rows that leave the
+# viewport; they are tagged once their image is read, so tiles still waiting
+# on theirs are looked at again. A MutationObserver wakes the loop as soon as
+# new tiles render, and the board counts as exhausted after a few ticks with
+# no new pins. The largest srcset candidate is preferred over src
+# since it is closest to the original.
+SCROLL_AND_COLLECT_PINS_JS = """
+async () => {
+    let collected = 0;
+    const collect = async () => {
+        const tiles = document.querySelectorAll('[data-test-id="pin"]:not([data-collected])');
+        const pins = [];
+        for (const pin of tiles) {
+            const link = pin.querySelector('a[href*="/pin/"]');
+            const img = pin.querySelector('img[src*="pinimg"]');
+            // A tile whose image has not rendered yet is read on a later tick.
+            if (!img) continue;
+            pin.dataset.collected = '1';
+            const src = img.srcset ? img.srcset.split(',').pop().trim().split(' ')[0] : img.src;
+            pins.push({href: link ? link.href : null, src: src});
+        }
+        // Hand each tick's pins to Python right away so their downloads
+        // start while the board keeps scrolling.
+        if (pins.length) await window.reportPins(pins);
+        collected += pins.length;
+        return pins.length;
+    };
+    const settle = () => new Promise(resolve => {
+        const done = () => {
+            observer.disconnect();
+            clearTimeout(timer);
+            resolve();
+        };
+        const observer = new MutationObserver(() => setTimeout(done, 200));
+        const timer = setTimeout(done, 1500);
+        observer.observe(document.body, {childList: true, subtree: true});
+    });
+
+    let idleTicks = 0;
+    while (idleTicks < 3) {
+        idleTicks = (await collect()) ? 0 : idleTicks + 1;
+        window.scrollBy(0, window.innerHeight * 2);
+        await settle();
+    }
+    return collected;
+}
+"""
+
 
 class PinterestDownloader:
-    def __init__(self, output_folder="pinterest_images"):
+    def __init__(self, output_folder="pinterest_images", rebuild_index=False,
+                 persist_session=True):
         self.output_folder = output_folder
-        Path(output_folder).mkdir(parents=True, exist_ok=True)
-        self.downloaded_hashes = set()
+        self.output_path = Path(output_folder)
+        self.output_path.mkdir(parents=True, exist_ok=True)
+        # Downloaded images are tracked by a Bloom filter rather than a set so
+        # memory stays flat for huge boards; a hit is confirmed against the
+        # file on disk, whose name is derived from the image URL.
+        self.downloaded_hashes = ScalableBloomFilter(
+            initial_capacity=100_000, error_rate=0.001)
         self.skipped_hashes = set()
-        self.db_file = ".pinterest_db.json"
-        self.load_database()
-
-    def load_database(self):
-        if os.path.exists(self.db_file):
-            try:
-                with open(self.db_file, 'r') as f:
-                    db = json.load(f)
-                    self.downloaded_hashes = set(db.get('downloaded', []))
-                    self.skipped_hashes = set(db.get('skipped', []))
-            except:
-                pass
-
-        for filename in os.listdir(self.output_folder):
-            if filename.endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
-                hash_part = filename.split(
-                    '_')[0] if '_' in filename else filename.split('.')[0]
-                self.downloaded_hashes.add(hash_part)
+        self.db_file = self.output_path / '.pinterest_db.sqlite'
+        # Earlier versions kept outcomes in this file in the working
+        # directory. Its md5 keys cannot match the current ones and other
+        # output folders may share it, so it is left alone.
+        self.legacy_db_file = Path(".pinterest_db.json")
+        self.profile_dir = "pw_profile"
+        self.persist_session = persist_session
+        # A single writer thread keeps disk writes off the event loop while
+        # preserving the order chunks are written in.
+        self.disk_writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='disk-writer')
+        self.unsaved_outcomes = 0
+        self.load_database(rebuild_index)
+        atexit.register(self.commit_outcomes)
+
+    def load_database(self, rebuild_index=False):
+        # With WAL each commit is one small append instead of a rewrite of
+        # everything recorded so far; outcomes are still grouped into
+        # transactions by record_outcome.
+        self.conn = sqlite3.connect(self.db_file, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS downloaded (hash TEXT PRIMARY KEY)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS skipped (hash TEXT PRIMARY KEY)')
+        # user_version is set by the first scan's own transaction, so a scan
+        # that fails part-way is retried on the next run.
+        if self.conn.execute('PRAGMA user_version').fetchone()[0] < DB_VERSION:
+            self.create_database()
+        elif rebuild_index:
+            self.rebuild_index()
+
+        for (img_hash,) in self.conn.execute('SELECT hash FROM downloaded'):
+            self.downloaded_hashes.add(img_hash)
+        self.skipped_hashes = {
+            img_hash for (img_hash,) in self.conn.execute('SELECT hash FROM skipped')}
 
         print(f"Found {len(self.downloaded_hashes)} existing images")
         print(f"Found {len(self.skipped_hashes)} skipped images (too small)")
 
-    def save_database(self):
-        db = {
-            'downloaded': list(self.downloaded_hashes),
-            'skipped': list(self.skipped_hashes)
-        }
-        with open(self.db_file, 'w') as f:
-            json.dump(db, f, indent=2)
+    def create_database(self):
+        # A new database starts from the images already in the output folder.
+        if self.legacy_db_file.is_file():
+            print(f"Ignoring {self.legacy_db_file}: it predates the current image keys")
+        self.conn.execute('BEGIN')
+        self.conn.executemany('INSERT OR IGNORE INTO downloaded VALUES (?)',
+                              ((img_hash,) for img_hash in self.scan_output_folder()))
+        self.conn.execute(f'PRAGMA user_version = {DB_VERSION}')
+        self.conn.execute('COMMIT')
+
+    def rebuild_index(self):
+        # The database is trusted on normal runs; only an explicit rebuild
+        # walks the output folder to pick up files added or removed by hand.
+        print(f"Rebuilding index from {self.output_folder}...")
+        self.conn.execute('BEGIN')
+        self.conn.execute('DELETE FROM downloaded')
+        self.conn.executemany('INSERT OR IGNORE INTO downloaded VALUES (?)',
+                              ((img_hash,) for img_hash in self.scan_output_folder()))
+        self.conn.execute('COMMIT')
+
+    def scan_output_folder(self):
+        hashes = []
+        renames = []
+        with os.scandir(self.output_folder) as entries:
+            for entry in entries:
+                name = entry.name
+                dot = name.rfind('.')
+                # is_file() comes from the directory listing itself on most
+                # platforms, so it costs no extra stat.
+                if (dot < 0 or name[dot:].lower() not in IMAGE_EXTENSIONS
+                        or not entry.is_file()):
+                    continue
+                underscore = name.find('_')
+                if underscore < 0:
+                    hashes.append(name[:dot])
+                    continue
+                img_hash = name[:underscore]
+                # Files saved under the old md5 keys still carry the pinimg
+                # name after the prefix; rename them to their CDN id so the
+                # name can be derived again from the URL.
+                cdn_id = LEGACY_FILENAME_ID_RE.match(name[underscore + 1:])
+                if cdn_id and cdn_id.group()[:12] != img_hash:
+                    img_hash = cdn_id.group()[:12]
+                    renames.append((name, f"{img_hash}{name[underscore:]}"))
+                hashes.append(img_hash)
+
+        for old_name, new_name in renames:
+            (self.output_path / old_name).replace(self.output_path / new_name)
+        return hashes
+
+    def commit_outcomes(self):
+        if self.conn.in_transaction:
+            self.conn.execute('COMMIT')
+        self.unsaved_outcomes = 0
+
+    def record_outcome(self, img_hash, downloaded):
+        if not self.conn.in_transaction:
+            self.conn.execute('BEGIN')
+        if downloaded:
+            self.downloaded_hashes.add(img_hash)
+            self.conn.execute('INSERT OR IGNORE INTO downloaded VALUES (?)', (img_hash,))
+        else:
+            self.skipped_hashes.add(img_hash)
+            self.conn.execute('INSERT OR IGNORE INTO skipped VALUES (?)', (img_hash,))
+        self.unsaved_outcomes += 1
+        if self.unsaved_outcomes >= DB_COMMIT_EVERY:
+            self.commit_outcomes()
+
+    def get_image_hash(self, img_url, pin_url=None):
+        # pinimg names files after a content hash shared by every size of an
+        # image, so it is already a stable key. Repins of one image share it,
+        # which is why it wins over the pin id; that id (then a URL digest) only keys
+        # images whose URL does not follow the scheme.
+        match = IMAGE_ID_RE.search(img_url)
+        if match:
+            return match.group(1)[:12]
+        match = PIN_ID_RE.search(pin_url or '')
+        if match:
+            return match.group(1)
+        return hashlib.blake2b(img_url.encode(), digest_size=6,
+                               usedforsecurity=False).hexdigest()
+
+    def get_image_path(self, img_hash, img_url, extension=None):
+        filename = img_url.rsplit('/', 1)[-1]
+        if extension is not None:
+            filename = filename.rsplit('.', 1)[0] + extension
+        return self.output_path / f"{img_hash}_{filename}"
+
+    def has_image_file(self, img_hash, img_url):
+        return any(
+            self.get_image_path(img_hash, img_url, extension).exists()
+            or (self.output_path / (img_hash + extension)).exists()
+            for extension in IMAGE_EXTENSIONS
+        )
+
+    def get_known_outcome(self, img_hash, img_url):
+        if img_hash in self.downloaded_hashes and self.has_image_file(img_hash, img_url):
+            return "Skipped (already downloaded)"
+        if img_hash in self.skipped_hashes:
+            return "Skipped (too small)"
+        return None
+
+    def get_original_url(self, img_url):
+        return IMAGE_SIZE_RE.sub('/originals/', img_url, count=1)
+
+    def create_http_client(self):
+        # pinimg serves HTTP/2, so concurrent fetches share a few multiplexed
+        # connections instead of opening one TCP/TLS handshake each. A failed
+        # connection attempt is retried before it counts as a failed fetch;
+        # errors once a response has started are not.
+        transport = httpx.AsyncHTTPTransport(
+            http2=True,
+            retries=3,
+            # Closeup fetches are bounded by the page pool instead of the
+            # fetch limit, so the pool has room for both.
+            limits=httpx.Limits(max_connections=FETCH_WORKERS + FALLBACK_WORKERS,
+                                max_keepalive_connections=FETCH_WORKERS + FALLBACK_WORKERS,
+                                keepalive_expiry=60)
+        )
+        return httpx.AsyncClient(
+            transport=transport,
+            headers={'User-Agent': USER_AGENT,
+                     'Referer': 'https://www.pinterest.com/'},
+            timeout=httpx.Timeout(20, pool=None),
+            follow_redirects=True
+        )
+
+    def load_cookies(self, client, cookies):
+        for cookie in cookies:
+            client.cookies.set(cookie['name'], cookie['value'],
+                               domain=cookie['domain'], path=cookie['path'])
+
+    async def warm_up_connection(self, client):
+        # Resolves and opens the pinimg connection while the browser starts
+        # and logs in, so the first fetch does not pay for DNS and TLS.
+        try:
+            await client.head('https://i.pinimg.com/')
+        except httpx.HTTPError:
+            pass
+
+    def get_original_candidates(self, img_url):
+        # Original URLs are built from the thumbnail, whose extension is not
+        # always the original's, so the other common formats are tried next.
+        base, extension = os.path.splitext(img_url)
+        return [img_url] + [base + other for other in ORIGINAL_EXTENSIONS
+                            if other != extension]
+
+    async def stream_to_file(self, client, img_url, path):
+        loop = asyncio.get_running_loop()
+        async with client.stream('GET', img_url) as response:
+            response.raise_for_status()
+            # A declared size under the threshold settles the pin without
+            # reading the body or touching the disk.
+            content_length = int(response.headers.get('Content-Length', 0))
+            if 0 < content_length < MIN_IMAGE_BYTES:
+                return content_length
+            file_size = 0
+            with open(path, 'wb') as f:
+                async for chunk in response.aiter_bytes(1024 * 1024):
+                    await loop.run_in_executor(self.disk_writer, f.write, chunk)
+                    file_size += len(chunk)
+        return file_size
+
+    async def fetch_image(self, client, idx, img_hash, img_url):
+        temp_path = self.output_path / f"temp_{img_hash}"
+        try:
+            for candidate_url in self.get_original_candidates(img_url):
+                try:
+                    file_size = await self.stream_to_file(
+                        client, candidate_url, temp_path)
+                    img_url = candidate_url
+                    break
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code not in (403, 404):
+                        raise
+            else:
+                raise httpx.HTTPError("no original found")
+
+            if file_size < MIN_IMAGE_BYTES:
+                self.record_outcome(img_hash, downloaded=False)
+                outcome = f"Skipped (too small {file_size / 1024:.1f} KB)"
+            else:
+                temp_path.replace(self.get_image_path(img_hash, img_url))
+                self.record_outcome(img_hash, downloaded=True)
+                outcome = f"Downloaded ({file_size / 1024:.1f} KB)"
+        except (httpx.HTTPError, OSError) as e:
+            outcome = f"Failed ({str(e)})"
+        finally:
+            # Also runs when a timed-out closeup cancels the fetch.
+            temp_path.unlink(missing_ok=True)
 
-    def get_image_hash(self, img_url):
-        return hashlib.md5(img_url.encode()).hexdigest()[:12]
+        print(f"[Pin {idx}] Fetched → {outcome}")
+        return outcome
 
-    def login_to_pinterest(self, page, username, password):
+    async def login_to_pinterest(self, page, username, password):
         try:
             print("Attempting to log in to Pinterest...")
-            page.goto("https://www.pinterest.com/login/")
-            page.wait_for_timeout(random.randint(1500, 2500))
+            await page.goto("https://www.pinterest.com/login/", wait_until='commit')
 
             email_input = page.locator('input[id="email"]')
-            if email_input.is_visible(timeout=5000):
-                email_input.fill(username)
-                page.wait_for_timeout(random.randint(300, 600))
-
+            try:
+                await email_input.wait_for(state='visible', timeout=5000)
+            except PlaywrightTimeout:
+                pass
+            if await email_input.is_visible():
+                await email_input.fill(username)
                 password_input = page.locator('input[id="password"]')
-                password_input.fill(password)
-                page.wait_for_timeout(random.randint(300, 600))
+                await password_input.fill(password)
+                await page.wait_for_timeout(random.uniform(0.6, 1.2) * 1000)
 
                 login_button = page.locator('button[type="submit"]').first
-                login_button.click()
+                await login_button.click()
 
                 print("Login credentials submitted. Waiting for login to complete...")
-                page.wait_for_timeout(random.randint(4000, 6000))
+                try:
+                    await page.wait_for_url(
+                        lambda url: "pinterest.com/login" not in url, timeout=10000)
+                except PlaywrightTimeout:
+                    pass
 
                 if "pinterest.com/login" not in page.url:
                     print("✓ Login successful!")
@@ -90,173 +441,383 @@ class PinterestDownloader:
             print(f"Error during automated login: {e}")
             return False
 
-    def download_pin(self, page, pin, idx, board_url):
-        current_scroll = page.evaluate("window.scrollY")
+    def is_pin_resource_response(self, response):
+        return 'PinResource/get' in response.url and response.status == 200
+
+    async def open_pin(self, page, pin_url):
+        # Client-side renders of the closeup fetch the pin through
+        # PinResource, whose payload already names the original image.
+        try:
+            async with page.expect_response(self.is_pin_resource_response,
+                                            timeout=PIN_RESOURCE_TIMEOUT) as response_info:
+                try:
+                    await page.goto(pin_url, wait_until='commit')
+                except PlaywrightTimeout as e:
+                    # A pooled page that failed to navigate still shows the
+                    # previous pin, so its image must not be used for this one.
+                    raise RuntimeError(f"Could not open pin: {e}") from e
+            data = await (await response_info.value).json()
+            return data['resource_response']['data']['images']['orig']['url']
+        except (PlaywrightTimeout, KeyError, TypeError, ValueError):
+            return None
+
+    async def download_with_button(self, page, img_hash, img_url):
+        more_button = page.get_by_role('button', name=MORE_OPTIONS_NAME).or_(
+            page.locator(MORE_OPTIONS_SELECTOR)).first
+        try:
+            await more_button.click(timeout=BUTTON_TIMEOUT)
+        except PlaywrightTimeout:
+            return "Failed (No More options button)"
+
+        download_button = page.get_by_role('menuitem', name=DOWNLOAD_BUTTON_NAME).or_(
+            page.locator(DOWNLOAD_BUTTON_SELECTOR)).first
+        try:
+            await download_button.wait_for(state='visible', timeout=BUTTON_TIMEOUT)
+        except PlaywrightTimeout:
+            return "Failed (No Download button)"
+
+        async with page.expect_download(timeout=DOWNLOAD_START_TIMEOUT) as download_info:
+            await download_button.click()
+        download = await download_info.value
+
+        # Playwright has already written the finished download to its own
+        # temp file, so it is measured there and saved once under its final
+        # name; small images never reach the output folder.
+        file_size = Path(await asyncio.wait_for(
+            download.path(), DOWNLOAD_TIMEOUT)).stat().st_size
+        if file_size < MIN_IMAGE_BYTES:
+            await download.delete()
+            self.record_outcome(img_hash, downloaded=False)
+            return f"Skipped (too small {file_size / 1024:.1f} KB)"
+
+        await download.save_as(self.get_image_path(
+            img_hash, img_url, Path(download.suggested_filename).suffix))
+        self.record_outcome(img_hash, downloaded=True)
+        return f"Downloaded ({file_size / 1024:.1f} KB)"
+
+    async def download_pin(self, page, client, pin_url, idx):
         outcome = "Failed"
         try:
-            try:
-                pin.scroll_into_view_if_needed()
-                page.wait_for_timeout(random.randint(400, 900))
-                pin.click()
-            except:
-                page.wait_for_timeout(random.randint(400, 900))
-                pin.scroll_into_view_if_needed()
-                pin.click()
-
-            page.wait_for_timeout(random.randint(1000, 2000))
-
-            # Check for new tabs (ads/popups) and close them
-            if len(page.context.pages) > 1:
-                for p in page.context.pages[1:]:
-                    print(f"[Pin {idx}] Closing unexpected new tab (ad)")
-                    p.close()
-                page.bring_to_front()
-
-            img = page.locator('img[src*="pinimg"]').first
-            img_src = img.get_attribute('src')
-            img_hash = self.get_image_hash(img_src)
-
-            if img_hash in self.downloaded_hashes:
-                outcome = "Skipped (already downloaded)"
-            elif img_hash in self.skipped_hashes:
-                outcome = "Skipped (too small)"
+            orig_url = await self.open_pin(page, pin_url)
+            if orig_url:
+                img_url = orig_url
+            else:
+                img = page.locator(PIN_IMAGE_SELECTOR).first
+                await img.wait_for(state='visible', timeout=IMAGE_WAIT_TIMEOUT)
+                img_url = self.get_original_url(await img.get_attribute('src'))
+            img_hash = self.get_image_hash(img_url, pin_url)
+
+            known_outcome = self.get_known_outcome(img_hash, img_url)
+            if known_outcome:
+                outcome = known_outcome
             else:
-                more_button = None
-                for selector in ['[aria-label="More options"]', '[data-test-id="more-options-button"]',
-                                 'button:has-text("More")', '[aria-label="More actions"]']:
+                if orig_url:
                     try:
-                        more_button = page.locator(selector).first
-                        if more_button.is_visible(timeout=1000):
-                            break
-                    except:
-                        continue
-
-                if not more_button:
-                    outcome = "Failed (No More options button)"
-                else:
-                    more_button.click()
-                    page.wait_for_timeout(random.randint(300, 600))  # faster
-
-                    download_button = None
-                    for selector in ['text="Download image"', 'text="Download"',
-                                     '[data-test-id="download-button"]', 'div:has-text("Download image")']:
-                        try:
-                            download_button = page.locator(selector).first
-                            if download_button.is_visible(timeout=1000):
-                                break
-                        except:
-                            continue
-
-                    if not download_button:
-                        outcome = "Failed (No Download button)"
-                    else:
-                        with page.expect_download(timeout=20000) as download_info:
-                            download_button.click()
-                        download = download_info.value
-
-                        temp_path = os.path.join(
-                            self.output_folder, f"temp_{img_hash}")
-                        download.save_as(temp_path)
-                        file_size_kb = os.path.getsize(temp_path) / 1024
-
-                        if file_size_kb < 70:
-                            os.remove(temp_path)
-                            self.skipped_hashes.add(img_hash)
-                            self.save_database()
-                            outcome = f"Skipped (too small {file_size_kb:.1f} KB)"
-                        else:
-                            new_filename = f"{img_hash}_{download.suggested_filename}"
-                            final_path = os.path.join(
-                                self.output_folder, new_filename)
-                            os.rename(temp_path, final_path)
-                            self.downloaded_hashes.add(img_hash)
-                            self.save_database()
-                            outcome = f"Downloaded ({file_size_kb:.1f} KB)"
+                        outcome = await asyncio.wait_for(
+                            self.fetch_image(client, idx, img_hash, orig_url),
+                            CLOSEUP_FETCH_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        outcome = "Failed (fetch timed out)"
+                if not orig_url or outcome.startswith("Failed"):
+                    outcome = await self.download_with_button(
+                        page, img_hash, img_url)
 
         except Exception as e:
             outcome = f"Failed ({str(e)})"
-        finally:
-            try:
-                page.go_back(wait_until='domcontentloaded')
-                page.wait_for_timeout(random.randint(500, 900))
-                page.evaluate(f"window.scrollTo(0, {current_scroll})")
-                page.wait_for_timeout(random.randint(300, 700))
 
-                # Ensure we returned to the board page
-                if board_url not in page.url:
-                    raise Exception(
-                        f"Did not return to board page! Current URL: {page.url}")
+        print(f"[Pin {idx}] Clicked → {outcome}")
+        return outcome.startswith("Downloaded")
 
-            except Exception as e:
-                print(f"[Pin {idx}] ERROR: {e}")
-                raise e
+    async def download_pin_from_pool(self, context, pages, client, pin_url, idx,
+                                     timeout):
+        # Closeup pages are opened on first use and then handed from pin to
+        # pin through the queue instead of being created and torn down each time.
+        # The slot goes back even when opening its page fails, so the pool
+        # never shrinks.
+        page = await pages.get()
+        try:
+            if page is None:
+                new_page = await context.new_page()
+                new_page.set_default_timeout(CLOSEUP_TIMEOUT)
+                await new_page.route('**/*', self.block_closeup_extras)
+                page = new_page
+            return await asyncio.wait_for(
+                self.download_pin(page, client, pin_url, idx), timeout)
+        finally:
+            pages.put_nowait(page)
 
-        print(f"[Pin {idx}] Clicked → {outcome}")
+    async def process_pin(self, context, pages, client, semaphore, retry_queue,
+                          pin_url, idx, img_hash, img_url):
+        async with semaphore:
+            outcome = await self.fetch_image(client, idx, img_hash, img_url)
+        if outcome.startswith("Failed") and pin_url:
+            try:
+                return await self.download_pin_from_pool(
+                    context, pages, client, pin_url, idx, PIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                print(f"[Pin {idx}] Closeup timed out, retrying at the end")
+                retry_queue.append((pin_url, idx))
+                return None
         return outcome.startswith("Downloaded")
 
-    def download_images_from_board(self, board_url, headless=False, username=None, password=None):
-        with sync_playwright() as p:
-            browser = p.chromium.launch(
-                headless=headless,
-                args=['--disable-blink-features=AutomationControlled']
-            )
-            context = browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
-                accept_downloads=True,
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
-            )
-            page = context.new_page()
-
-            if username and password:
-                login_success = self.login_to_pinterest(
-                    page, username, password)
-                if not login_success and not headless:
-                    input(
-                        "\nPlease complete login manually in the browser and press Enter to continue...")
+    def queue_pins(self, pin_queue, pins):
+        for pin_info in pins:
+            pin_queue.put_nowait(pin_info)
+
+    async def process_pins(self, context, client, semaphore, pages, seen_hashes,
+                           pin_queue):
+        # Pins arrive from the board scroll while it is still running, and
+        # each one falls back to its closeup as soon as its own fetch fails,
+        # so slow pins overlap the scroll, the remaining fetches and each other.
+        retry_queue = deque()
+        tasks = []
+        known_count = 0
+        while True:
+            try:
+                pin_info = await pin_queue.get()
+            except asyncio.CancelledError:
+                for task in tasks:
+                    task.cancel()
+                raise
+            if pin_info is None:
+                break
+            img_url = self.get_original_url(pin_info['src'])
+            img_hash = self.get_image_hash(img_url, pin_info['href'])
+            # seen_hashes is shared by every board in the run, so an image
+            # pinned to two boards is only fetched once.
+            if img_hash in seen_hashes:
+                continue
+            seen_hashes.add(img_hash)
+            idx = len(seen_hashes)
+            # Known pins are settled from the tile alone, before any
+            # request or closeup is spent on them.
+            known_outcome = self.get_known_outcome(img_hash, img_url)
+            if known_outcome:
+                print(f"[Pin {idx}] {known_outcome}")
+                known_count += 1
             else:
-                page.goto("https://www.pinterest.com/login/")
+                tasks.append(asyncio.create_task(self.process_pin(
+                    context, pages, client, semaphore, retry_queue,
+                    pin_info['href'], idx, img_hash, img_url)))
+        print(f"Skipped {known_count} already-known pins, "
+              f"waiting on {len(tasks)} downloads...")
+
+        # One pin's unexpected error must not abort the board and leave the
+        # other pins running unawaited.
+        results = []
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                print(f"Pin failed: {result}")
+                result = False
+            results.append(result)
+        while retry_queue:
+            pin_url, idx = retry_queue.popleft()
+            try:
+                results.append(await self.download_pin_from_pool(
+                    context, pages, client, pin_url, idx, RETRY_PIN_TIMEOUT))
+            except asyncio.TimeoutError:
+                print(f"[Pin {idx}] Clicked → Failed (timed out)")
+                results.append(False)
+        return [result for result in results if result is not None], known_count
+
+    async def scrape_board(self, context, client, semaphore, pages, seen_hashes,
+                           page, board_url):
+        pin_queue = asyncio.Queue()
+        await page.expose_function(
+            'reportPins', functools.partial(self.queue_pins, pin_queue))
+        processing = asyncio.create_task(self.process_pins(
+            context, client, semaphore, pages, seen_hashes, pin_queue))
+
+        print(f"Scrolling {board_url} and downloading pins...")
+        try:
+            pin_count = await page.evaluate(SCROLL_AND_COLLECT_PINS_JS)
+            await page.unroute('**/*', self.block_heavy_requests)
+            print(f"Collected {pin_count} pins from {board_url}.")
+        except asyncio.CancelledError:
+            processing.cancel()
+            raise
+        except Exception as e:
+            # Pins reported before the scroll stopped are still downloaded.
+            print(f"Scrolling {board_url} stopped early: {e}")
+        finally:
+            pin_queue.put_nowait(None)
+        return await processing
+
+    async def scrape_board_in_page(self, context, client, semaphore, pages,
+                                   seen_hashes, board_semaphore, board_url,
+                                   page=None, open_error=None):
+        async with board_semaphore:
+            owns_page = page is None
+            try:
+                if open_error is not None:
+                    raise open_error
+                if owns_page:
+                    page = await context.new_page()
+                    await page.route('**/*', self.block_heavy_requests)
+                    if not await self.open_board(page, board_url):
+                        raise RuntimeError("Redirected to login")
+                return await self.scrape_board(
+                    context, client, semaphore, pages, seen_hashes, page, board_url)
+            except Exception as e:
+                print(f"Failed to download board {board_url}: {e}")
+                return [], 0
+            finally:
+                if owns_page and page is not None:
+                    await page.close()
+
+    def is_blocked(self, request, resource_types):
+        return (request.resource_type in resource_types
+                or any(part in request.url for part in BLOCKED_URL_PARTS))
+
+    async def block_heavy_requests(self, route):
+        if self.is_blocked(route.request, BLOCKED_RESOURCE_TYPES):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def block_closeup_extras(self, route):
+        request = route.request
+        if (self.is_blocked(request, CLOSEUP_BLOCKED_RESOURCE_TYPES)
+                or (request.resource_type == 'image' and 'pinimg.com' not in request.url)):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def launch_context(self, p, headless):
+        options = dict(
+            service_workers='block',
+            viewport={'width': 1920, 'height': 1080},
+            accept_downloads=True,
+            user_agent=USER_AGENT
+        )
+        if not self.persist_session:
+            browser = await p.chromium.launch(
+                headless=headless,
+                args=CHROMIUM_ARGS,
+                ignore_default_args=['--enable-automation'])
+            return await browser.new_context(**options)
+        # A persistent profile keeps cookies, the HTTP cache and V8's code
+        # cache between runs, so only the first run pays for a cold start.
+        return await p.chromium.launch_persistent_context(
+            self.profile_dir,
+            headless=headless,
+            args=CHROMIUM_ARGS,
+            ignore_default_args=['--enable-automation'],
+            **options
+        )
+
+    async def log_in(self, page, headless, username, password):
+        if username and password:
+            login_success = await self.login_to_pinterest(
+                page, username, password)
+            if not login_success and not headless:
                 input(
-                    "\nPlease log in to Pinterest manually and press Enter to continue...")
+                    "\nPlease complete login manually in the browser and press Enter to continue...")
+        else:
+            await page.goto("https://www.pinterest.com/login/")
+            input(
+                "\nPlease log in to Pinterest manually and press Enter to continue...")
+
+    async def open_board(self, page, board_url):
+        # Return as soon as the navigation commits and wait on the pin tiles
+        # themselves rather than on the whole document.
+        await page.goto(board_url, timeout=60000, wait_until='commit')
+        try:
+            await page.wait_for_selector(
+                PIN_SELECTOR, state='attached', timeout=10000)
+        except PlaywrightTimeout:
+            # An empty board has no tiles at all; only a login redirect
+            # means the board could not be opened.
+            return '/login' not in page.url
+        return True
+
+    async def open_first_board(self, page, board_url):
+        # Only a login redirect stops the run here; any other failure is
+        # handed to the board's own handler, like a failure on a later board.
+        try:
+            return not await self.open_board(page, board_url), None
+        except Exception as e:
+            return False, e
 
-            page.goto(board_url, timeout=60000, wait_until='domcontentloaded')
-            page.wait_for_timeout(random.randint(2000, 3000))
+    async def is_logged_in(self, context):
+        return any(cookie['name'] == '_auth' and cookie['value'] == '1'
+                   for cookie in await context.cookies('https://www.pinterest.com'))
 
-            print("Starting scrolling & downloading pins...")
+    def download_images_from_board(self, board_url, headless=False, username=None, password=None):
+        board_urls = [board_url] if isinstance(board_url, str) else list(board_url)
+        try:
+            return asyncio.run(self.download_board(board_urls, headless, username, password))
+        finally:
+            self.commit_outcomes()
+            # Fold the write-ahead log into the database once per run, so
+            # the next run starts from a compact snapshot.
+            self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    async def download_board(self, board_urls, headless=False, username=None, password=None):
+        async with async_playwright() as p, self.create_http_client() as client:
+            warm_up = asyncio.create_task(self.warm_up_connection(client))
+            context = await self.launch_context(p, headless)
+            page = context.pages[0] if context.pages else await context.new_page()
+
+            logged_in = await self.is_logged_in(context)
+            if logged_in:
+                print(f"Using saved login session from {self.profile_dir}")
+            else:
+                await self.log_in(page, headless, username, password)
+
+            # The first board also proves the session, so it is opened on
+            # its own before the rest start in parallel.
+            await page.route('**/*', self.block_heavy_requests)
+            redirected, open_error = await self.open_first_board(page, board_urls[0])
+            if redirected:
+                # A login made just now is not retried with the same
+                # credentials.
+                if not logged_in:
+                    raise RuntimeError("Still redirected to login after logging in")
+                # The saved session expired server-side even though its
+                # cookie is still in the profile.
+                print("Saved login session was rejected, logging in again...")
+                await page.unroute('**/*', self.block_heavy_requests)
+                await self.log_in(page, headless, username, password)
+                await page.route('**/*', self.block_heavy_requests)
+                redirected, open_error = await self.open_first_board(page, board_urls[0])
+                if redirected:
+                    raise RuntimeError("Still redirected to login after logging in")
+
+            # Images are fetched straight from pinimg over a shared connection
+            # pool; the download button is only used when that fetch fails.
+            self.load_cookies(client, await context.cookies())
+            await warm_up
+
+            # Every board shares the fetch limit, the closeup page pool and
+            # the set of hashes already handled in this run.
+            semaphore = asyncio.Semaphore(FETCH_WORKERS)
+            pages = asyncio.Queue()
+            for _ in range(FALLBACK_WORKERS):
+                pages.put_nowait(None)
             seen_hashes = set()
+            board_semaphore = asyncio.Semaphore(BOARD_WORKERS)
+            try:
+                board_results = await asyncio.gather(
+                    self.scrape_board_in_page(
+                        context, client, semaphore, pages, seen_hashes,
+                        board_semaphore, board_urls[0], page, open_error),
+                    *(self.scrape_board_in_page(
+                        context, client, semaphore, pages, seen_hashes,
+                        board_semaphore, board_url)
+                      for board_url in board_urls[1:])
+                )
+            finally:
+                while not pages.empty():
+                    closeup_page = pages.get_nowait()
+                    if closeup_page is not None:
+                        await closeup_page.close()
+
             downloaded_count = 0
             failed_count = 0
-            idx = 1
-            scroll_pause_time = 1.2
-
-            while True:
-                pins = page.locator('[data-test-id="pin"]').all()
-                new_pin_found = False
-
-                for pin in pins:
-                    img = pin.locator('img[src*="pinimg"]').first
-                    img_src = img.get_attribute('src')
-                    img_hash = self.get_image_hash(img_src)
-                    if img_hash not in seen_hashes:
-                        new_pin_found = True
-                        seen_hashes.add(img_hash)
-                        success = self.download_pin(
-                            page, pin, idx, board_url)
-                        if success:
-                            downloaded_count += 1
-                        else:
-                            failed_count += 1
-                        idx += 1
-
-                # Double the scroll amount
-                scroll_amount = page.evaluate(
-                    "window.innerHeight * 2")  # doubled scroll
-                page.evaluate(f"window.scrollBy(0, {scroll_amount})")
-                page.wait_for_timeout(random.randint(
-                    int(scroll_pause_time*800), int(scroll_pause_time*1200)))
-
-                if not new_pin_found:
-                    print("No new pins detected. Finished scrolling.")
-                    break
+            for results, known_count in board_results:
+                downloaded_count += sum(results)
+                failed_count += known_count + len(results) - sum(results)
 
             print("\n" + "="*50)
             print(f"Downloaded: {downloaded_count}")
@@ -266,7 +827,7 @@ class PinterestDownloader:
 
             if not headless:
                 input("\nPress Enter to close the browser...")
-            browser.close()
+            await context.close()
 
 
 def main():
@@ -276,12 +837,16 @@ def main():
     board_url = os.getenv('PINTEREST_BOARD_URL')
     output_folder_env = os.getenv('OUTPUT_FOLDER')
     headless_env = os.getenv('HEADLESS')
+    rebuild_index_env = os.getenv('REBUILD_INDEX')
+    persist_session_env = os.getenv('PERSIST_SESSION')
     username = os.getenv('PINTEREST_USERNAME')
     password = os.getenv('PINTEREST_PASSWORD')
 
     if not board_url:
         board_url = input("Enter your Pinterest board URL: ").strip()
-    print(f"Board URL: {board_url}")
+    # Several boards can be given at once, separated by commas.
+    board_urls = [url.strip() for url in board_url.split(',') if url.strip()]
+    print(f"Board URL: {', '.join(board_urls)}")
 
     output_folder = output_folder_env if output_folder_env else "pinterest_images"
     print(f"Output folder: {output_folder}")
@@ -289,11 +854,18 @@ def main():
     headless = headless_env.lower() in ('true', '1', 'yes') if headless_env else False
     print(f"Headless: {headless}")
 
-    downloader = PinterestDownloader(output_folder=output_folder)
+    rebuild_index = rebuild_index_env.lower() in ('true', '1', 'yes') if rebuild_index_env else False
+
+    persist_session = persist_session_env.lower() in ('true', '1', 'yes') if persist_session_env else True
+    print(f"Persist session: {persist_session}")
+
+    downloader = PinterestDownloader(
+        output_folder=output_folder, rebuild_index=rebuild_index,
+        persist_session=persist_session)
 
     try:
         downloader.download_images_from_board(
-            board_url, headless=headless, username=username, password=password
+            board_urls, headless=headless, username=username, password=password
         )
     except KeyboardInterrupt:
         print("\nDownload interrupted by user")